@@ -0,0 +1,5 @@
+#Names of the bookkeeping files the downloader writes next to the documents.
+#Kept dependency-free so the downloader and the API can both import it.
+
+# Per-file sidecar holding the HTTP validators of a download
+META_SUFFIX = '.meta'
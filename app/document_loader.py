@@ -1,56 +1,124 @@
 # Handles multi-format docs
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List
 from langchain.schema import Document
 from unstructured.partition.pdf import partition_pdf
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
 from unstructured.partition.docx import partition_docx
 from unstructured.partition.pptx import partition_pptx
-import pytesseract
-from PIL import Image
 import pandas as pd
+from image_ocr import extract_text_from_images
 
-def extract_text_from_image(img_path: str) -> str:
-    """OCR for images in manuals/diagrams."""
+# Layout model for hi_res partitioning, read by unstructured when partition_pdf runs.
+# yolox runs on ONNX Runtime; with the default requirements (CPU-only onnxruntime) it
+# stays on the CPU. It only uses CUDA if onnxruntime-gpu is installed instead of onnxruntime.
+os.environ.setdefault("UNSTRUCTURED_HI_RES_MODEL_NAME", "yolox")
+
+def has_text_layer(pdf_path: str, pages: int = 3, min_chars: int = 50) -> bool:
+    """True when the first pages carry selectable text, i.e. no OCR is needed."""
     try:
-        return pytesseract.image_to_string(Image.open(img_path))
+        texts = [
+            "".join(el.get_text() for el in page if isinstance(el, LTTextContainer))
+            for page in extract_pages(pdf_path, maxpages=pages)
+        ]
     except Exception as e:
-        print(f"OCR failed: {e}")
-        return ""
+        print(f"PDF text probe failed: {e}")
+        return False
+    return bool(texts) and sum(len(t.strip()) for t in texts) > min_chars * len(texts)
 
 def load_pdf_with_tables_images(pdf_path: str) -> List[Document]:
     """Extract text, tables, and images from PDFs."""
-    elements = partition_pdf(
-        filename=pdf_path,
-        extract_images_in_pdf=True,
-        infer_table_structure=True,
-        strategy="hi_res",
-        ocr_languages="eng"
-    )
+    if has_text_layer(pdf_path):
+        # Native text: skip the layout model and OCR entirely
+        elements = partition_pdf(
+            filename=pdf_path,
+            infer_table_structure=True,
+            strategy="fast"
+        )
+    else:
+        elements = partition_pdf(
+            filename=pdf_path,
+            extract_images_in_pdf=True,
+            infer_table_structure=True,
+            strategy="hi_res",
+            ocr_languages="eng"
+        )
     
-    content = []
-    for elem in elements:
+    image_paths = [elem.metadata.image_path for elem in elements
+                   if elem.category == "Image" and elem.metadata.image_path]
+    ocr_texts = iter(extract_text_from_images(image_paths))
+
+    # Labels, separators and texts stay separate pieces: each character is copied once, by the join
+    pieces = []
+    for i, elem in enumerate(elements):
+        if i:
+            pieces.append("\n\n")
         if elem.category == "Table":
-            content.append(f"TABLE:\n{elem.text}")
+            pieces += ("TABLE:\n", elem.text)
         elif elem.category == "Image":
-            img_text = extract_text_from_image(elem.metadata.image_path)
-            content.append(f"IMAGE_DESCRIPTION:\n{img_text}")
+            img_text = next(ocr_texts) if elem.metadata.image_path else ""
+            pieces += ("IMAGE_DESCRIPTION:\n", img_text)
         else:
-            content.append(elem.text)
+            pieces.append(elem.text)
     
-    return [Document(page_content="\n\n".join(content), metadata={"source": pdf_path})]
+    return [Document(page_content="".join(pieces), metadata={"source": pdf_path})]
 
 def load_docx_with_tables(docx_path: str) -> List[Document]:
     """Extract text and tables from DOCX."""
     elements = partition_docx(filename=docx_path)
-    tables = [elem.text for elem in elements if elem.category == "Table"]
-    text = [elem.text for elem in elements if elem.category != "Table"]
-    return [Document(page_content="\n\n".join(text + [f"TABLE:\n{t}" for t in tables]), metadata={"source": docx_path})]
+    tables, text = [], []
+    for elem in elements:
+        (tables if elem.category == "Table" else text).append(elem.text)
+    text.extend(f"TABLE:\n{t}" for t in tables)
+    return [Document(page_content="\n\n".join(text), metadata={"source": docx_path})]
 
 def load_csv_autoparts(csv_path: str) -> List[Document]:
     """Load structured car parts data."""
-    df = pd.read_csv(csv_path)
-    return [Document(page_content=f"CAR PARTS DATA:\n{df.to_markdown()}", metadata={"source": csv_path})]
+    try:
+        df = pd.read_csv(csv_path, engine="pyarrow")
+    except (ImportError, ValueError):
+        # pyarrow missing or unable to parse this file
+        df = pd.read_csv(csv_path)
+    # Pipe-separated rows: no column padding to compute or embed
+    text = df.to_csv(sep="|", index=False)
+    return [Document(page_content=f"CAR PARTS DATA:\n{text}", metadata={"source": csv_path})]
 
 def load_pptx_slides(pptx_path: str) -> List[Document]:
     """Extract text and notes from PPTX."""
     elements = partition_pptx(filename=pptx_path)
-    return [Document(page_content="\n\n".join([elem.text for elem in elements]), metadata={"source": pptx_path})]
\ No newline at end of file
+    return [Document(page_content="\n\n".join([elem.text for elem in elements]), metadata={"source": pptx_path})]
+
+def load_text_file(txt_path: str) -> List[Document]:
+    """Load plain-text manuals and notices."""
+    with open(txt_path, encoding="utf-8", errors="ignore") as f:
+        return [Document(page_content=f.read(), metadata={"source": txt_path})]
+
+LOAD_WORKERS = 4
+
+LOADERS = {
+    ".pdf": load_pdf_with_tables_images,
+    ".docx": load_docx_with_tables,
+    ".csv": load_csv_autoparts,
+    ".pptx": load_pptx_slides,
+    ".txt": load_text_file,
+}
+
+def load_document(path: Path) -> List[Document]:
+    """Load one file with the loader matching its suffix; unreadable files are skipped."""
+    try:
+        return LOADERS[path.suffix.lower()](str(path))
+    except Exception as e:
+        print(f"Loading {path} failed, skipping it: {e}")
+        return []
+
+def load_documents(paths: List[Path]) -> List[Document]:
+    """Load a few files at a time, overlapping hi_res layout inference and file I/O."""
+    if not paths:
+        return []
+    # Kept small: pdfminer is pure Python, and OCR already has its own process pool
+    with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(paths))) as executor:
+        return list(itertools.chain.from_iterable(executor.map(load_document, paths)))
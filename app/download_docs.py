@@ -4,15 +4,20 @@ Automotive Document Downloader
 Downloads various automotive documents for RAG chatbot training/testing
 """
 import os
+import json
+import shutil
 import requests
 import time
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urlparse, urljoin
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 # import hashlib  # Unused import removed
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from data_files import META_SUFFIX
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +30,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Hosts are downloaded concurrently; files on the same host stay sequential
+MAX_HOST_WORKERS = 8
+PER_HOST_DELAY = 0.5
+COPY_BUFFER_SIZE = 1024 * 1024
+VERIFY_HEAD_SIZE = 512
+VERIFY_STATE_FILE = '.verified.json'
+# Statuses suggesting the server blocks our client rather than the resource
+UA_REJECTION_STATUSES = (403, 406)
+
+def _close_response(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
 class DocumentDownloader:
     def __init__(self, base_dir: str = "data"):
         self.base_dir = Path(base_dir)
@@ -48,7 +66,7 @@ class DocumentDownloader:
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504],
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=16, pool_maxsize=32)
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
@@ -57,51 +75,133 @@ class DocumentDownloader:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
 
-    def download_file(self, url: str, filename: str, directory: Path) -> bool:
-        """Download a file with error handling and progress tracking"""
+    def _meta_path(self, file_path: Path) -> Path:
+        """Sidecar file holding the HTTP validators of a downloaded file"""
+        return file_path.with_name(file_path.name + META_SUFFIX)
+
+    def _load_meta(self, file_path: Path) -> Dict[str, str]:
         try:
-            logger.info(f"Downloading: {filename} from {url}")
-            response = self.session.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            file_path = directory / filename
-            
-            # Check if file already exists and has same size
-            if file_path.exists():
-                existing_size = file_path.stat().st_size
-                remote_size = int(response.headers.get('content-length', 0))
-                if existing_size == remote_size and remote_size > 0:
-                    logger.info(f"File {filename} already exists with correct size, skipping")
-                    return True
-                    
-            # Download the file
-            with open(file_path, 'wb') as f:
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            if downloaded % (1024 * 1024) == 0:  # Log every MB
-                                logger.info(f"Progress: {progress:.1f}% ({downloaded}/{total_size} bytes)")
-                                
-            logger.info(f"Successfully downloaded: {filename}")
-            return True
-            
+            with open(self._meta_path(file_path), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, file_path: Path, url: str, headers) -> None:
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag', ''),
+            'last_modified': headers.get('Last-Modified', ''),
+            'content_length': headers.get('Content-Length', ''),
+        }
+        with open(self._meta_path(file_path), 'w') as f:
+            json.dump(meta, f)
+
+    def _head(self, url: str, headers: Dict[str, str]):
+        """HEAD request used to decide between skip, resume and full download"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=15, headers=headers)
+            if response.ok:
+                return response.headers
         except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to download {filename}: {e}")
-            return False
+            logger.debug(f"HEAD request failed for {url}: {e}")
+        return {}
+
+    def _is_current(self, existing_size: int, headers, meta: Dict[str, str]) -> bool:
+        """True if the local file has the remote size and its validator did not change"""
+        remote_size = int(headers.get('Content-Length', 0) or 0)
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        stored_validator = meta.get('etag') or meta.get('last_modified')
+        unchanged = not (validator and stored_validator) or validator == stored_validator
+        return bool(existing_size) and existing_size == remote_size and unchanged
+
+    def _write_response(self, response, file_path: Path, url: str, mode: str, meta_headers) -> None:
+        """Stream a response body to disk"""
+        # Store validators first so an interrupted download can be resumed
+        self._save_meta(file_path, url, meta_headers)
+
+        # Stream the body straight to disk in 1 MiB blocks
+        response.raw.decode_content = True
+        with open(file_path, mode) as f:
+            shutil.copyfileobj(response.raw, f, length=COPY_BUFFER_SIZE)
+
+    def _log_failure(self, filename: str, error: Exception) -> None:
+        if isinstance(error, requests.exceptions.RequestException):
+            logger.error(f"Failed to download {filename}: {error}")
+        else:
+            logger.error(f"Unexpected error downloading {filename}: {error}")
+
+    def download_file(self, url: str, filename: str, directory: Path,
+                      headers: Optional[Dict[str, str]] = None) -> bool:
+        """Download a file with error handling, skipping and resuming"""
+        try:
+            return self._download(url, filename, directory, headers)
         except Exception as e:
-            logger.error(f"Unexpected error downloading {filename}: {e}")
+            self._log_failure(filename, e)
             return False
 
+    def _download(self, url: str, filename: str, directory: Path,
+                  headers: Optional[Dict[str, str]] = None) -> bool:
+        """Download a file, skipping or resuming it when possible; raises on failure"""
+        logger.info(f"Downloading: {filename} from {url}")
+        file_path = directory / filename
+        # Ask for the identity encoding so Content-Length and ranges match the bytes on disk
+        request_headers = {'Accept-Encoding': 'identity', **(headers or {})}
+
+        remote = self._head(url, request_headers)
+        remote_size = int(remote.get('Content-Length', 0) or 0)
+        validator = remote.get('ETag') or remote.get('Last-Modified')
+        existing_size = file_path.stat().st_size if file_path.exists() else 0
+
+        meta = self._load_meta(file_path)
+        stored_validator = meta.get('etag') or meta.get('last_modified')
+
+        # Check if file already exists, has same size and the server copy did not change
+        if self._is_current(existing_size, remote, meta):
+            logger.info(f"File {filename} already exists with correct size, skipping")
+            return True
+
+        # Resume a partial download only when we can prove it is the same resource
+        resume = 0 < existing_size < remote_size and validator and validator == stored_validator
+        if resume:
+            request_headers['Range'] = f"bytes={existing_size}-"
+            request_headers['If-Range'] = validator
+
+        with self.session.get(url, stream=True, timeout=30, headers=request_headers) as response:
+            response.raise_for_status()
+
+            # HEAD rejected or without a size: decide from the GET headers before writing
+            if not remote_size and self._is_current(existing_size, response.headers, meta):
+                logger.info(f"File {filename} already exists with correct size, skipping")
+                return True
+
+            # A 200 means the server ignored the range: start over
+            if resume and response.status_code == 206:
+                mode = 'ab'
+                logger.info(f"Resuming {filename} from byte {existing_size}")
+            else:
+                mode = 'wb'
+                logger.info(f"Writing {filename} ({response.headers.get('Content-Length', 'unknown')} bytes)")
+
+            self._write_response(response, file_path, url, mode, remote or response.headers)
+
+        logger.info(f"Successfully downloaded: {filename}")
+        return True
+
     def download_with_fallbacks(self, url: str, filename: str, directory: Path) -> bool:
         """Download with multiple fallback strategies"""
         # Try original URL first
-        if self.download_file(url, filename, directory):
-            return True
+        try:
+            return self._download(url, filename, directory)
+        except requests.exceptions.HTTPError as e:
+            self._log_failure(filename, e)
+            # Only a rejection of the client is worth retrying with other user agents;
+            # 404s, timeouts and DNS errors would fail the same way
+            status = e.response.status_code if e.response is not None else None
+            if status not in UA_REJECTION_STATUSES:
+                return False
+        except Exception as e:
+            self._log_failure(filename, e)
+            return False
             
         # Try with different user agents
         user_agents = [
@@ -110,22 +210,42 @@ class DocumentDownloader:
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
         ]
         
-        for ua in user_agents:
-            try:
-                logger.info(f"Retrying {filename} with different user agent")
-                old_ua = self.session.headers['User-Agent']
-                self.session.headers['User-Agent'] = ua
-                if self.download_file(url, filename, directory):
-                    self.session.headers['User-Agent'] = old_ua # Restore UA before returning
-                    return True
-                self.session.headers['User-Agent'] = old_ua
-            except Exception as e:
-                logger.warning(f"Fallback attempt failed for {filename}: {e}")
-                self.session.headers['User-Agent'] = old_ua # Ensure UA is restored on error
-                continue
-                
+        # Send every user agent at once; the first accepted response is written to disk.
+        # The UA is passed per request: the session is shared between download threads.
+        logger.info(f"Retrying {filename} with {len(user_agents)} different user agents")
+        file_path = directory / filename
+        executor = ThreadPoolExecutor(max_workers=len(user_agents))
+        attempts = [executor.submit(self._open_with_user_agent, url, ua) for ua in user_agents]
+        try:
+            for attempt in as_completed(attempts):
+                try:
+                    with attempt.result() as response:
+                        logger.info(f"Writing {filename} ({response.headers.get('Content-Length', 'unknown')} bytes)")
+                        self._write_response(response, file_path, url, 'wb', response.headers)
+                except Exception as e:
+                    logger.warning(f"Fallback attempt failed for {filename}: {e}")
+                    continue
+                logger.info(f"Successfully downloaded: {filename}")
+                return True
+        finally:
+            # Release the connections of the other attempts without waiting for them
+            for attempt in attempts:
+                attempt.add_done_callback(_close_response)
+            executor.shutdown(wait=False, cancel_futures=True)
+
         return False
 
+    def _open_with_user_agent(self, url: str, ua: str) -> requests.Response:
+        """Streamed GET with this user agent; raises if the server rejects it"""
+        response = self.session.get(url, stream=True, timeout=30,
+                                    headers={'User-Agent': ua, 'Accept-Encoding': 'identity'})
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+
     def get_automotive_documents(self) -> Dict[str, List[Tuple[str, str]]]:
         """
         Returns a dictionary of automotive documents to download
@@ -377,25 +497,50 @@ WARRANTY INFORMATION
 
         logger.info("✅ Created comprehensive sample documents for all categories")
 
+    def _download_host_batch(self, jobs: List[Tuple[str, str, Path]]) -> List[Tuple[str, bool]]:
+        """Download every file of a single host sequentially"""
+        results = []
+        for i, (url, filename, directory) in enumerate(jobs):
+            if i:
+                # Add delay between downloads to the same host to be respectful
+                time.sleep(PER_HOST_DELAY)
+            results.append((filename, self.download_with_fallbacks(url, filename, directory)))
+        return results
+
     def download_all_documents(self):
         """Download all automotive documents"""
         documents = self.get_automotive_documents()
         total_downloaded = 0
         total_failed = 0
-        
+
+        # Group by host so different servers are hit in parallel
+        jobs_by_host = defaultdict(list)
         for category, doc_list in documents.items():
-            logger.info(f"\n=== Downloading {category.upper()} documents ===")
             directory = self.directories[category]
             for url, filename in doc_list:
-                success = self.download_with_fallbacks(url, filename, directory)
-                if success:
-                    total_downloaded += 1
-                else:
-                    total_failed += 1
-                    logger.warning(f"All download attempts failed for {filename}")
-                # Add delay between downloads to be respectful
-                time.sleep(1)
-                
+                jobs_by_host[urlparse(url).netloc].append((url, filename, directory))
+
+        logger.info(f"\n=== Downloading documents from {len(jobs_by_host)} hosts ===")
+        with ThreadPoolExecutor(max_workers=MAX_HOST_WORKERS) as executor:
+            futures = {
+                executor.submit(self._download_host_batch, jobs): host
+                for host, jobs in jobs_by_host.items()
+            }
+            for future in as_completed(futures):
+                host = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"Download worker for {host} crashed: {e}")
+                    total_failed += len(jobs_by_host[host])
+                    continue
+                for filename, success in results:
+                    if success:
+                        total_downloaded += 1
+                    else:
+                        total_failed += 1
+                        logger.warning(f"All download attempts failed for {filename}")
+
         # Create sample documents
         self.create_sample_documents()
         
@@ -411,7 +556,7 @@ WARRANTY INFORMATION
         """List all downloaded files with their sizes"""
         logger.info(f"\n=== Downloaded Files ===")
         for category, directory in self.directories.items():
-            files = list(directory.glob('*'))
+            files = [p for p in directory.glob('*') if p.suffix != META_SUFFIX]
             if files:
                 logger.info(f"\n{category.upper()}:")
                 for file_path in files:
@@ -420,31 +565,60 @@ WARRANTY INFORMATION
             else:
                 logger.info(f"\n{category.upper()}: No files")
 
+    def _check_file(self, file_path: Path, size: int) -> Optional[str]:
+        """Return a problem description, or None if the file looks valid"""
+        if size == 0:
+            return "Empty file"
+        suffix = file_path.suffix.lower()
+        if suffix not in ('.pdf', '.csv'):
+            return None
+        # Only the first bytes are needed, whatever the file size
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            head = os.read(fd, VERIFY_HEAD_SIZE)
+        finally:
+            os.close(fd)
+        if suffix == '.pdf' and not head.startswith(b'%PDF'):
+            return "Invalid PDF file"
+        if suffix == '.csv' and b',' not in head.split(b'\n', 1)[0]:
+            return "Invalid CSV file"
+        return None
+
     def verify_downloads(self):
         """Verify that downloaded files are valid"""
         logger.info(f"\n=== Verifying Downloads ===")
+        # Files already verified with the same mtime and size are not read again
+        state_path = self.base_dir / VERIFY_STATE_FILE
+        try:
+            with open(state_path, 'r') as f:
+                verified = json.load(f)
+        except (OSError, ValueError):
+            verified = {}
+
+        still_valid = {}
         for category, directory in self.directories.items():
-            files = list(directory.glob('*'))
+            files = [p for p in directory.glob('*') if p.suffix != META_SUFFIX]
             for file_path in files:
                 try:
-                    # Basic file validation
-                    if file_path.stat().st_size == 0:
-                        logger.warning(f"Empty file: {file_path}")
-                    elif file_path.suffix.lower() == '.pdf':
-                        # Basic PDF validation (check for PDF header)
-                        with open(file_path, 'rb') as f:
-                            if not f.read(4) == b'%PDF':
-                                logger.warning(f"Invalid PDF file: {file_path}")
-                    elif file_path.suffix.lower() == '.csv':
-                        # Basic CSV validation
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f: # Added errors='ignore' for robustness
-                            first_line = f.readline()
-                            if ',' not in first_line:
-                                logger.warning(f"Invalid CSV file: {file_path}")
+                    st = file_path.stat()
+                    signature = [st.st_mtime_ns, st.st_size]
+                    key = str(file_path)
+                    if verified.get(key) != signature:
+                        problem = self._check_file(file_path, st.st_size)
+                        if problem:
+                            logger.warning(f"{problem}: {file_path}")
+                            continue
+                    still_valid[key] = signature
                     logger.info(f"✓ Valid: {file_path.name}")
                 except Exception as e:
                     logger.error(f"Error verifying {file_path}: {e}")
 
+        try:
+            with open(state_path, 'w') as f:
+                json.dump(still_valid, f)
+        except OSError as e:
+            logger.warning(f"Could not save verification state: {e}")
+
 def main():
     """Main function to run the document downloader"""
     print("Automotive Document Downloader")
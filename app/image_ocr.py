@@ -0,0 +1,125 @@
+#OCR for images extracted from documents. Kept free of torch/unstructured/langchain
+#imports: it is the module the OCR worker processes import.
+
+import os
+import threading
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from hashlib import blake2b
+from pathlib import Path
+from typing import List
+from PIL import Image
+import numpy as np
+
+# OCR results keyed by a hash of the image bytes; only the text is stored
+OCR_CACHE_DIR = Path(os.environ.get("OCR_CACHE_DIR", "./cache/ocr"))
+
+MIN_OCR_PIXELS = 64 * 64
+MIN_OCR_STD = 5.0
+MAX_OCR_SIDE = 2000
+# Below this many images a PDF is OCR'd in-process; starting workers would cost more
+OCR_POOL_MIN_IMAGES = 8
+
+# One Tesseract instance per process, created on first use so the language model is loaded once
+_tess_api = None
+_tess_checked = False
+_tess_lock = threading.Lock()
+
+def _get_tess_api():
+    """Shared tesserocr API, or None to fall back to pytesseract. Call with _tess_lock held."""
+    global _tess_api, _tess_checked
+    if not _tess_checked:
+        _tess_checked = True
+        try:
+            import tesserocr
+            kwargs = {"lang": "eng"}
+            if os.environ.get("TESSDATA_PREFIX"):
+                kwargs["path"] = os.environ["TESSDATA_PREFIX"]
+            _tess_api = tesserocr.PyTessBaseAPI(**kwargs)
+        except Exception as e:
+            print(f"tesserocr unavailable, using pytesseract: {e}")
+    return _tess_api
+
+@lru_cache(maxsize=4096)
+def _load_cached_ocr(digest: str) -> str:
+    """Read a cached OCR result. A miss raises, so it is not memoized."""
+    return (OCR_CACHE_DIR / f"{digest}.txt").read_text(encoding="utf-8")
+
+def _store_cached_ocr(digest: str, text: str) -> None:
+    """Atomically write an OCR result to the disk cache."""
+    OCR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=OCR_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, OCR_CACHE_DIR / f"{digest}.txt")
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _ocr_image(img_path: str) -> str:
+    with Image.open(img_path) as src:
+        img = src.convert("L")
+    # Tiny or flat crops (borders, blank decorations) carry no text worth OCRing
+    if img.width * img.height < MIN_OCR_PIXELS or np.asarray(img, dtype=np.uint8).std() < MIN_OCR_STD:
+        return ""
+    # Tesseract gains nothing from very large images but pays per pixel
+    img.thumbnail((MAX_OCR_SIDE, MAX_OCR_SIDE), Image.LANCZOS)
+    with _tess_lock:
+        api = _get_tess_api()
+        if api is not None:
+            try:
+                api.SetImage(img)
+                return api.GetUTF8Text()
+            finally:
+                api.Clear()
+    import pytesseract
+    return pytesseract.image_to_string(img)
+
+def extract_text_from_image(img_path: str) -> str:
+    """OCR for images in manuals/diagrams, cached by image content."""
+    try:
+        with open(img_path, "rb") as f:
+            digest = blake2b(f.read(), digest_size=16).hexdigest()
+        try:
+            return _load_cached_ocr(digest)
+        except OSError:
+            pass
+        text = _ocr_image(img_path)
+        try:
+            _store_cached_ocr(digest, text)
+        except OSError as e:
+            print(f"OCR cache write failed: {e}")
+        return text
+    except Exception as e:
+        print(f"OCR failed: {e}")
+        return ""
+
+def _init_worker() -> None:
+    # Runs before Tesseract is loaded in the worker: its OpenMP threads would
+    # otherwise fight the other workers for cores. The parent process is untouched.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all PDFs, created on first use."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # spawn: forking while another thread holds the Tesseract lock would deadlock the child
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _ocr_pool
+
+def extract_text_from_images(img_paths: List[str]) -> List[str]:
+    """OCR several images, in parallel for large batches, preserving their order."""
+    if len(img_paths) < OCR_POOL_MIN_IMAGES:
+        return [extract_text_from_image(p) for p in img_paths]
+    return list(_get_ocr_pool().map(extract_text_from_image, img_paths))
@@ -1,24 +1,123 @@
 #FastAPI Backend
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from document_loader import load_pdf_with_tables_images, load_docx_with_tables, load_csv_autoparts, load_pptx_slides
-from rag_processor import RAGProcessor
+from data_files import META_SUFFIX
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+import logging
 import os
 
-app = FastAPI()
-rag = RAGProcessor()
+DATA_DIR = Path(os.environ.get("DATA_DIR", "data"))
+# Questions arriving within this window are embedded in one forward pass
+BATCH_WINDOW = 0.02
+# Download bookkeeping written next to the documents
+IGNORED_SUFFIXES = {META_SUFFIX}
+
+logger = logging.getLogger(__name__)
+
+# document_loader and rag_processor (torch, unstructured, langchain, faiss) are imported
+# inside functions only: under "python main.py" every spawned OCR worker re-runs this module
+if TYPE_CHECKING:
+    from rag_processor import RAGProcessor
+
+def find_documents() -> List[Path]:
+    from document_loader import LOADERS
+    paths = []
+    for p in sorted(DATA_DIR.rglob("*")):
+        if not p.is_file() or p.name.startswith(".") or p.suffix.lower() in IGNORED_SUFFIXES:
+            continue
+        if p.suffix.lower() in LOADERS:
+            paths.append(p)
+        else:
+            logger.warning(f"No loader for {p}, not indexed")
+    return paths
+
+def build_index(rebuild: bool = False) -> int:
+    """(Re)load the vectorstore for everything under DATA_DIR."""
+    from document_loader import load_documents
+    paths = find_documents()
+    # Built once per input set, then loaded from ./cache/faiss on later starts
+    rag.vectorstore = rag.load_or_build(paths, load_documents, rebuild=rebuild) if paths else None
+    return len(paths)
+
+class QueryBatcher:
+    """Micro-batches concurrent question embeddings."""
+
+    def __init__(self, rag: "RAGProcessor"):
+        self.rag = rag
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def embed(self, question: str) -> List[float]:
+        vector = self.rag.cached_query_embedding(question)
+        if vector is not None:
+            return vector
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((question, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + BATCH_WINDOW
+            while (timeout := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                vectors = await run_in_threadpool(self.rag.embed_queries, [q for q, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+# Created in lifespan, never at import, for the same reason
+rag: Optional["RAGProcessor"] = None
+batcher: Optional[QueryBatcher] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global rag, batcher
+    from rag_processor import RAGProcessor
+    # Loads the embedding model once per process
+    rag = RAGProcessor()
+    batcher = QueryBatcher(rag)
+    build_index()
+    worker = asyncio.create_task(batcher.run())
+    yield
+    worker.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     question: str
 
 @app.post("/ask")
 async def ask_question(request: QueryRequest):
+    if rag.vectorstore is None:
+        raise HTTPException(status_code=503, detail="No documents indexed")
     try:
-        docs = rag.query(vectorstore, request.question)
+        vector = await batcher.embed(request.question)
+        docs = await run_in_threadpool(rag.query_by_vector, rag.vectorstore, vector)
         return {"answer": docs[0].page_content}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/reindex")
+def reindex():
+    try:
+        return {"documents": build_index(rebuild=True)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
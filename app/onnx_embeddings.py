@@ -0,0 +1,114 @@
+#Int8-quantized MiniLM embeddings on ONNX Runtime for CPU inference.
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import torch
+from langchain.embeddings.base import Embeddings
+
+INT8_MODEL = "model-int8.onnx"
+FP32_MODEL = "model.onnx"
+
+class _LastHiddenState(torch.nn.Module):
+    """Exportable wrapper returning only the token embeddings."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(
+            input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+        )[0]
+
+def export_quantized_model(model_name: str, model_dir: Path) -> None:
+    """Export a sentence-transformers model to ONNX and quantize its weights to int8."""
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Built in a temp dir and renamed into place, so a killed export leaves no partial model
+    model_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=model_dir.parent))
+    try:
+        st_model = SentenceTransformer(model_name, device="cpu")
+        st_model.tokenizer.save_pretrained(str(tmp_dir))
+        (tmp_dir / "max_seq_length").write_text(str(st_model.max_seq_length))
+
+        dummy = st_model.tokenizer(["export"], return_tensors="pt")
+        axes = {0: "batch", 1: "sequence"}
+        torch.onnx.export(
+            _LastHiddenState(st_model[0].auto_model).eval(),
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            str(tmp_dir / FP32_MODEL),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": axes, "attention_mask": axes, "token_type_ids": axes,
+                "last_hidden_state": axes,
+            },
+            opset_version=14,
+        )
+        quantize_dynamic(
+            str(tmp_dir / FP32_MODEL), str(tmp_dir / INT8_MODEL), weight_type=QuantType.QInt8
+        )
+
+        if model_dir.exists() and not (model_dir / INT8_MODEL).exists():
+            # Leftovers without a model, e.g. from an older interrupted export
+            shutil.rmtree(model_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, model_dir)
+        except OSError:
+            # Another process finished the same export first
+            if not (model_dir / INT8_MODEL).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+class OnnxEmbeddings(Embeddings):
+    """Mean-pooled, L2-normalized sentence embeddings from an int8 ONNX model."""
+
+    def __init__(self, model_dir: Path, batch_size: int = 64):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_seq_length = int((model_dir / "max_seq_length").read_text())
+        self.batch_size = batch_size
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            str(model_dir / INT8_MODEL), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+def load_onnx_embeddings(model_name: str, model_dir: Path, batch_size: int) -> Optional[OnnxEmbeddings]:
+    """Int8 embeddings, exporting the model on first use. None if ONNX Runtime is unusable."""
+    try:
+        if not (model_dir / INT8_MODEL).exists():
+            export_quantized_model(model_name, model_dir)
+        return OnnxEmbeddings(model_dir, batch_size=batch_size)
+    except Exception as e:
+        print(f"ONNX embeddings unavailable, using PyTorch: {e}")
+        return None
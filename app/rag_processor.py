@@ -1,24 +1,229 @@
 #Handles chunking, embeddings (using all-MiniLM-L6-v2), and FAISS vector storage.
 
+import os
+import uuid
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+import faiss
+import numpy as np
+import torch
+from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.vectorstores import FAISS
-from typing import List
+from langchain.vectorstores.utils import DistanceStrategy
+from typing import Callable, List, Optional
+from onnx_embeddings import load_onnx_embeddings
+
+# "hnsw" (default), "ivfpq" for large corpora, or "flat" for exact search
+INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "hnsw").lower()
+HNSW_M = 32
+IVF_NLIST = 256
+IVF_TRAIN_SIZE = 10000
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+QUERY_CACHE_SIZE = 1024
+CHUNK_OVERLAP = 32
+# "onnx" runs int8 MiniLM on CPU; "torch" keeps the PyTorch model. GPUs always use torch.
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "onnx").lower()
+ONNX_MODEL_DIR = Path(os.environ.get("ONNX_MODEL_DIR", "./onnx_minilm"))
+FAISS_CACHE_DIR = Path(os.environ.get("FAISS_CACHE_DIR", "./cache/faiss"))
+TMP_PREFIX = "tmp-"
 
 class RAGProcessor:
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        # Set by the API at startup; shared by every request
+        self.vectorstore: Optional[FAISS] = None
+        # LRU of question embeddings, keyed by normalized question text
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        batch_size = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+        self.embeddings = None
+        if device == "cpu" and EMBEDDING_BACKEND == "onnx":
+            self.embeddings = load_onnx_embeddings(EMBEDDING_MODEL, ONNX_MODEL_DIR, batch_size)
+        if self.embeddings is not None:
+            tokenizer, max_seq_length = self.embeddings.tokenizer, self.embeddings.max_seq_length
+        else:
+            self.embeddings = HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL,
+                model_kwargs={"device": device},
+                encode_kwargs={
+                    "batch_size": batch_size,
+                    # Unit vectors: inner product == cosine similarity
+                    "normalize_embeddings": True,
+                },
+            )
+            tokenizer, max_seq_length = self.embeddings.client.tokenizer, self.embeddings.client.max_seq_length
+        # Chunks measured in MiniLM tokens so each one fits the model window (256)
+        self.text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer,
+            chunk_size=max_seq_length,
+            chunk_overlap=CHUNK_OVERLAP
         )
 
+    def _build_index(self, vectors: np.ndarray) -> faiss.Index:
+        """Approximate inner-product index over the chunk embeddings."""
+        dim = vectors.shape[1]
+        # IVF-PQ needs enough points to train its centroids, otherwise use HNSW
+        if INDEX_TYPE == "ivfpq" and len(vectors) >= IVF_NLIST * 39:
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, IVF_NLIST, 48, 8, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors[:IVF_TRAIN_SIZE])
+            index.nprobe = 16
+        elif INDEX_TYPE == "flat":
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = 64
+        index.add(vectors)
+        return index
+
+    @staticmethod
+    def dedupe_chunks(chunks: List[Document]) -> List[Document]:
+        """Drop chunks whose text was already seen (headers, TOCs, boilerplate)."""
+        seen = set()
+        unique = []
+        for chunk in chunks:
+            digest = blake2b(chunk.page_content.encode(), digest_size=16).digest()
+            if digest not in seen:
+                seen.add(digest)
+                unique.append(chunk)
+        return unique
+
     def process_documents(self, documents: List[Document]) -> FAISS:
         """Split, embed, and store documents."""
-        chunks = self.text_splitter.split_documents(documents)
-        vectorstore = FAISS.from_documents(chunks, self.embeddings)
+        chunks = self.dedupe_chunks(self.text_splitter.split_documents(documents))
+        vectors = np.asarray(
+            self.embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32
+        )
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        vectorstore = FAISS(
+            embedding_function=self.embeddings,
+            index=self._build_index(vectors),
+            docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+            index_to_docstore_id=dict(enumerate(ids)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
         return vectorstore
 
+    def cache_key(self, paths: List[Path]) -> str:
+        """Fingerprint of the input file contents and index settings."""
+        digest = hashlib.sha256(f"{EMBEDDING_MODEL}|{type(self.embeddings).__name__}|{INDEX_TYPE}|{CHUNK_OVERLAP}".encode())
+        for path in sorted(paths):
+            # Content, not mtime: the downloader rewrites identical sample files on every run
+            content = blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    content.update(block)
+            digest.update(f"|{path}|{path.stat().st_size}|{content.hexdigest()}".encode())
+        return digest.hexdigest()
+
+    def save_vectorstore(self, vectorstore: FAISS, key: str) -> None:
+        """Persist a vectorstore under the cache directory for this key."""
+        FAISS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=FAISS_CACHE_DIR, prefix=TMP_PREFIX)
+        try:
+            vectorstore.save_local(tmp_dir)
+        except Exception as e:
+            print(f"Saving the vectorstore cache failed: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        try:
+            os.replace(tmp_dir, FAISS_CACHE_DIR / key)
+        except OSError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Only losing the race to another process storing the same key is expected
+            if not (FAISS_CACHE_DIR / key / "index.faiss").exists():
+                print(f"Storing the vectorstore cache failed: {e}")
+                return
+        self._prune_cache(key)
+
+    def _prune_cache(self, key: str) -> None:
+        """Delete indexes cached for older inputs or settings."""
+        for entry in FAISS_CACHE_DIR.iterdir():
+            # Temp dirs belong to saves still in progress
+            if entry.is_dir() and entry.name != key and not entry.name.startswith(TMP_PREFIX):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def load_vectorstore(self, key: str) -> Optional[FAISS]:
+        """Load a cached vectorstore, memory-mapping the index read-only."""
+        folder = FAISS_CACHE_DIR / key
+        if not (folder / "index.faiss").exists():
+            return None
+        index = faiss.read_index(
+            str(folder / "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        )
+        # Same layout as FAISS.save_local; the cache is written by this process only
+        with open(folder / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
+    def load_or_build(self, paths: List[Path],
+                      load_documents: Callable[[List[Path]], List[Document]],
+                      rebuild: bool = False) -> Optional[FAISS]:
+        """Reuse the cached index for these files, or build and cache it. None if nothing loads."""
+        key = self.cache_key(paths)
+        vectorstore = None if rebuild else self.load_vectorstore(key)
+        if vectorstore is None:
+            documents = load_documents(paths)
+            if not documents:
+                return None
+            vectorstore = self.process_documents(documents)
+            if rebuild:
+                shutil.rmtree(FAISS_CACHE_DIR / key, ignore_errors=True)
+            self.save_vectorstore(vectorstore, key)
+        return vectorstore
+
+    @staticmethod
+    def _normalize_question(question: str) -> str:
+        return question.strip().lower()
+
+    def cached_query_embedding(self, question: str) -> Optional[List[float]]:
+        """Embedding of a previously seen question, if still cached."""
+        key = self._normalize_question(question)
+        with self._query_cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+            return vector
+
+    def embed_queries(self, questions: List[str]) -> List[List[float]]:
+        """Embed questions, running a single batched forward pass for the misses."""
+        vectors = [self.cached_query_embedding(q) for q in questions]
+        misses = list(dict.fromkeys(
+            self._normalize_question(q) for q, v in zip(questions, vectors) if v is None
+        ))
+        if misses:
+            # embed_query is embed_documents on a single text for both embedding backends
+            fresh = dict(zip(misses, self.embeddings.embed_documents(misses)))
+            with self._query_cache_lock:
+                for key, vector in fresh.items():
+                    self._query_cache[key] = vector
+                    self._query_cache.move_to_end(key)
+                while len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+            vectors = [v if v is not None else fresh[self._normalize_question(q)]
+                       for q, v in zip(questions, vectors)]
+        return vectors
+
+    def query_by_vector(self, vectorstore: FAISS, vector: List[float], k=3) -> List[Document]:
+        """Retrieve relevant chunks for an already embedded question."""
+        return vectorstore.similarity_search_by_vector(vector, k=k)
+
     def query(self, vectorstore: FAISS, question: str, k=3) -> List[Document]:
         """Retrieve relevant chunks."""
-        return vectorstore.similarity_search(question, k=k)
\ No newline at end of file
+        return self.query_by_vector(vectorstore, self.embed_queries([question])[0], k=k)
@@ -4,6 +4,11 @@ import requests
 # Config
 API_URL = "http://localhost:8000/ask"  # Docker service name if using compose
 
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive connection pool to the API, shared across reruns."""
+    return requests.Session()
+
 st.title("🚗 Car Manual RAG Chatbot")
 st.write("Ask questions about car manuals, specs, and parts!")
 
@@ -25,7 +30,7 @@ if prompt := st.chat_input("Ask about cars..."):
     
     # Call FastAPI backend
     try:
-        response = requests.post(API_URL, json={"question": prompt})
+        response = get_session().post(API_URL, json={"question": prompt}, timeout=30)
         answer = response.json().get("answer", "No answer found")
     except Exception as e:
         answer = f"Error: {str(e)}"